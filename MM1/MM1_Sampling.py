@@ -7,55 +7,172 @@ import matplotlib.pyplot as plt
 # The term M/M/1 is used only to imply that the system contains one input and output ports.
 # Lindley Equation: Computes the queue length with a discrete-time stochastic process.
 
-def perform_bernoulli_trial(p):
-    """Performs a single Bernoulli trial with success probability 'p'.
+# Variance Reduction: any of the options below can be passed after the arrival rate through the terminal.
+#   crn         - common random numbers: replication r reuses the same seeded streams at every traffic intensity
+#   antithetic  - replications are run in pairs, the second one driven by 1 - U for every uniform U of the first
+#   control     - control variate: corrects the queue length with the observed number of enqueues, whose mean λ per phase is known
+# The number of replications R (default 10) and the phases per replication N can be set next to the options.
+# N defaults to the longest equilibrium time 10 / (1 - ρ)^2 of the swept traffic intensities (at least 100000),
+# and the same N is used for every traffic intensity so that common random numbers line up the sampled phases.
+# e.g. python MM1_Sampling.py 0.5 crn antithetic control R=20 N=50000
+# Without any option, a single unseeded run of 100000 phases is made for every traffic intensity.
+
+def perform_bernoulli_trial(p, draw=random.random):
+    """Performs a single Bernoulli trial with success probability 'p', using the uniform variate returned by 'draw'.
        Function returns a boolean of the trial's success."""
-    return random.random() < p
+    return draw() < p
 
 
-lamb = float(sys.argv[1])   # average arrival rate: mean number of enqueues made per unit time. Lambda must be set less than min(ρ)
-print("Arrival Rate: " + str(lamb))
-print()
-x = []
-y = []
+def uniform_stream(seed, antithetic=False):
+    """Uniform variates for the enqueues or the dequeues of one replication, seeded with 'seed'.
+       Function returns the drawing function, which yields 1 - U instead of U for the antithetic replication."""
+    rng = random.Random(seed)
+    if antithetic:
+        return lambda: 1 - rng.random()
+    return rng.random
 
-# Simulation: This file needs to run a parameter (arrival rate) through the terminal.
-# The simulation aims to compute the average queue length in respect to the traffic intensity.
-for rho in np.arange(0.9, 1.0, 0.01):
-    mu = lamb / rho     # average service rate: mean number of dequeues made per unit time, (0.0, 1.0)
-    N = 100000          # Sample size: needed to be fixed
-    queue_length = []
+
+def simulate_queue(mu, N, seed, antithetic=False):
+    """Runs a single replication of N phases with the service rate 'mu', unseeded if 'seed' is None.
+       Arrivals and services use separate streams, so the draws stay synchronized across traffic intensities.
+       Function returns the sample mean of the queue length, the number of enqueues and the number of phases sampled."""
+    arrival_draw = uniform_stream(None if seed is None else 2 * seed, antithetic)
+    service_draw = uniform_stream(None if seed is None else 2 * seed + 1, antithetic)
     queue = []
+    arrivals = 0
     wait = 0
-    x.append(rho)
     for t in range(N):          # Simulating N random variables
-        
+
         # Bernoulli trial for the arrival (Enqueueing)
-        arrival = perform_bernoulli_trial(lamb)
+        arrival = perform_bernoulli_trial(lamb, arrival_draw)
         if arrival:
             wait += 1
-    
+
         # Dequeueing the M/M/1 Queue
-        service = perform_bernoulli_trial(mu)
+        service = perform_bernoulli_trial(mu, service_draw)
         if service and wait > 0:
             wait -= 1
-    
+
         # Sampling the data
-        queue_length.append(wait)
         if t > N / 2:
             queue.append(wait)
+            arrivals += arrival
+
+    return np.average(queue), arrivals, len(queue)
+
+
+def control_coefficient(samples, arrivals):
+    """Estimates β of the control variate q - β (A - E[A]) by regression over the replications it corrects,
+       where A is the number of enqueues while sampling (bias of order 1 / R). Function returns β."""
+    if np.var(arrivals) == 0:
+        return 0
+    return np.cov(samples, arrivals)[0][1] / np.var(arrivals, ddof = 1)
+
 
-    mean = np.average(queue)
+def estimate_mean(samples, arrivals, expected_arrivals, beta=None, antithetic=False):
+    """Turns the replications' queue lengths into the units averaged for E[q(t)]:
+       corrected by the enqueue count when 'beta' is given, then averaged in antithetic pairs.
+       Function returns the units with the reduction factors of the control variate and of the pairs (None if unused)."""
+    samples = np.array(samples)
+    units = samples
+    cv_vrf = None
+    anti_vrf = None
+    if beta is not None:
+        units = samples - beta * (np.array(arrivals) - expected_arrivals)
+        cv_vrf = np.var(samples, ddof = 1) / np.var(units, ddof = 1)
+    if antithetic:
+        pairs = (units[0::2] + units[1::2]) / 2
+        anti_vrf = (np.var(units, ddof = 1) / len(units)) / (np.var(pairs, ddof = 1) / len(pairs))
+        units = pairs
+    return units, cv_vrf, anti_vrf
+
+
+lamb = float(sys.argv[1])   # average arrival rate: mean number of enqueues made per unit time. Lambda must be set less than min(ρ)
+rhos = np.arange(0.9, 1.0, 0.01)
+
+# Variance reduction options, with R=<replications> and N=<phases per replication>
+options = []
+R = None
+N = None
+for arg in sys.argv[2:]:
+    if arg.startswith("R="):
+        R = int(arg[2:])
+    elif arg.startswith("N="):
+        N = int(arg[2:])
+    elif arg in ("crn", "antithetic", "control"):
+        options.append(arg)
+    else:
+        sys.exit("Unknown option: " + arg)
+crn = "crn" in options
+antithetic = "antithetic" in options
+control = "control" in options
+
+if options:
+    R = R or 10
+    N = N or max(100000, max(int(10 / ((1 - rho) ** 2)) for rho in rhos))
+    if R < 2 or (antithetic and R % 2 == 1):
+        sys.exit("R must be at least 2 (and even for antithetic pairs) to estimate the variance reduction")
+else:
+    R = R or 1
+    N = N or 100000     # Sample size: needed to be fixed
+print("Arrival Rate: " + str(lamb))
+print("Variance Reduction: " + (", ".join(options) if options else "none"))
+print("Replications: " + str(R) + " x " + str(N) + " phases")
+print()
+
+x = []
+y = []
+err = []
+previous = None
+
+# Simulation: This file needs to run a parameter (arrival rate) through the terminal.
+# The simulation aims to compute the average queue length in respect to the traffic intensity.
+for i, rho in enumerate(rhos):
+    mu = lamb / rho     # average service rate: mean number of dequeues made per unit time, (0.0, 1.0)
+    x.append(rho)
+
+    samples = []
+    arrivals = []
+    for r in range(R):
+        # Streams are seeded only for common random numbers or antithetic pairs, which share the seed.
+        # Without common random numbers every traffic intensity gets fresh seeds.
+        seed = None
+        if crn or antithetic:
+            seed = (0 if crn else i * R) + (r // 2 if antithetic else r)
+        sample_mean, arrival_count, sampled = simulate_queue(mu, N, seed, antithetic and r % 2 == 1)
+        samples.append(sample_mean)
+        arrivals.append(arrival_count)
+
+    beta = control_coefficient(samples, arrivals) if control else None
+    units, cv_vrf, anti_vrf = estimate_mean(samples, arrivals, lamb * sampled, beta, antithetic)
+    mean = np.average(units)
 
     # Sampling the Queue-Length statistics from the simulation
     print("Traffic Intensity: " + str(rho))
     print("Average Queue Length: " + str(mean))
     print("E[q(t)] / (1 / (1 - ρ)): " + str(mean / (1 / (1 - rho))))    # testing convergence of the constant
+    if R > 1:
+        se = np.std(units, ddof = 1) / np.sqrt(len(units))
+        print("Standard Error: " + str(se))
+        err.append(se)
+    if control:
+        print("Control Variate Reduction Factor: " + str(cv_vrf))
+    if antithetic:
+        print("Antithetic Reduction Factor: " + str(anti_vrf))
+
+    # Common random numbers show up in the difference between consecutive traffic intensities
+    if crn and previous is not None:
+        crn_vrf = (np.var(units, ddof = 1) + np.var(previous, ddof = 1)) / np.var(units - previous, ddof = 1)
+        print("Common Random Numbers Reduction Factor (difference to the previous ρ): " + str(crn_vrf))
     print("--------------------------------------------------")
+    previous = units
     y.append(mean)
 
 plt.title("Average Queue Length relative to Traffic Intensity")
-plt.plot(x, y)
+if err:
+    plt.errorbar(x, y, yerr = err)
+else:
+    plt.plot(x, y)
 plt.xlabel("ρ")
 plt.ylabel("μ[q(t)]")
 plt.show()
@@ -4,27 +4,50 @@ import random
 import matplotlib.pyplot as plt
 from munkres import Munkres
 
-def perform_bernoulli_trial(p):
+'''
+Variance Reduction: any of the options below can be passed after the arrival rate through the terminal.
+    crn         - common random numbers: replication r reuses the same seeded streams at every traffic intensity.
+                  The scheduler is deterministic, so a different scheduler run with the same seeds sees the same arrivals.
+    antithetic  - replications are run in pairs, the second one driven by 1 - U for every uniform U of the first
+    control     - control variate: corrects the queue length with the observed arrival count, whose mean λn^2 per phase is known
+The number of replications R (default 10) and the phases per replication N can be set next to the options.
+With an option, N defaults to the longest equilibrium time 10 / (1 - ρ)^2 of the swept traffic intensities (at least 10000),
+and the same N is used for every traffic intensity so that common random numbers line up the sampled phases.
+e.g. python switch-traf.py 0.3 crn antithetic control R=20 N=20000
+Without any option, a single unseeded run of 10000 phases is made for every traffic intensity.
+'''
+
+def perform_bernoulli_trial(p, draw=random.random):
     '''
     Performs a single Bernoulli trial with success probability 'p'.
+    'draw' returns the uniform variate of the trial, e.g. a stream made by uniform_stream.
     Function returns a boolean of the trial's success.
     '''
-    return random.random() < p
+    return draw() < p
 
-lamb = float(sys.argv[1])    # arrival trial success rate
-N = 10000
-
-m = Munkres()
-traf = []
-qlen = []
+def uniform_stream(seed, antithetic=False):
+    '''
+    Random number stream of one replication of the switch.
+    Function returns a function drawing uniform variates seeded with 'seed', or 1 - U of those variates if antithetic.
+    '''
+    rng = random.Random(seed)
+    if antithetic:
+        return lambda: 1 - rng.random()
+    return rng.random
 
-# Simulation
-for rho in np.arange(0.9, 1.0, 0.01):   # rho: traffic intensity, noted as (ρ).
-    mu = lamb / rho * 3                  # service trial success rate -> here, 1 assumes that it dequeues every phase when the VOQ is not empty
+def simulate_switch(mu, N, seed, antithetic=False):
+    '''
+    Runs a single replication of the 3x3 switch for N phases with the service rate 'mu', unseeded if 'seed' is None.
+    Arrivals and services use separate streams, and the service trial is drawn every phase,
+    so the draws stay synchronized across traffic intensities.
+    Function returns the sample mean of the total queue length, the number of jobs arrived and the number of phases sampled.
+    '''
+    arrival_draw = uniform_stream(None if seed is None else 2 * seed, antithetic)
+    service_draw = uniform_stream(None if seed is None else 2 * seed + 1, antithetic)
     size = 0
     queue_length = []
     sample = []
-    traf.append(rho)
+    arrivals = 0
 
     '''
     Simple Packet Switch with size 3, initially empty.
@@ -36,19 +59,21 @@ for rho in np.arange(0.9, 1.0, 0.01):   # rho: traffic intensity, noted as (ρ).
         '''
         Arrival: Processed after Passing the Bernoulli trial
         '''
+        add = 0
         for x in range(len(packetSwitch)):
             for y in range(len(packetSwitch[x])):
-                if perform_bernoulli_trial(lamb):
+                if perform_bernoulli_trial(lamb, arrival_draw):
                     # weight of the job is fixed to 1.
                     packetSwitch[x][y] += 1
                     size += 1
+                    add += 1
 
         # Checking the status of the switch after arrival
         '''print("Current status of the switch is:")   # remove this later
         print(packetSwitch)'''
 
         # Additional Tasks
-        # 1. Compute the total number of non-empty queues 
+        # 1. Compute the total number of non-empty queues
         filled_queues = packetSwitch[np.where(packetSwitch > 0)]
         print(f"There is/are {filled_queues.size} non-empty queue(s) in the switch in phase {t}.")
 
@@ -64,7 +89,8 @@ for rho in np.arange(0.9, 1.0, 0.01):   # rho: traffic intensity, noted as (ρ).
         if not empty, process the Hungarian algorithm to find Max-Weight permutation matrix for selection
         set the packetSwitch of selected VOQs to zero after service
         '''
-        if size > 0 and perform_bernoulli_trial(mu):
+        service = perform_bernoulli_trial(mu, service_draw)     # drawn every phase to keep the streams synchronized
+        if size > 0 and service:
 
             # returns a list of tuples of the matrix's corrdinates
             maxWeight = m.compute((-1 * packetSwitch))
@@ -89,22 +115,126 @@ for rho in np.arange(0.9, 1.0, 0.01):   # rho: traffic intensity, noted as (ρ).
         queue_length.append(size)   # Actual Population
         if t > N / 2:               # Sample
             sample.append(size)
+            arrivals += add
 
-    # Recording Sampling
-    mean = np.average(sample)
+    return np.average(sample), arrivals, len(sample)
+
+def control_coefficient(samples, arrivals):
+    '''
+    Coefficient β of the control variate minimizing the variance of q - β (A - E[A]),
+    where A is the number of jobs arrived to the switch while sampling.
+    Function returns β estimated by regression over the replications it corrects (bias of order 1 / R).
+    '''
+    if np.var(arrivals) == 0:
+        return 0
+    return np.cov(samples, arrivals)[0][1] / np.var(arrivals, ddof = 1)
+
+def estimate_mean(samples, arrivals, expected_arrivals, beta=None, antithetic=False):
+    '''
+    Combines the replications of the switch into the units of the final estimate.
+    The arrival count correction with 'beta' is applied first, then the antithetic replications are averaged in pairs.
+    Function returns the units with the variance reduction factors of the control variate and of the antithetic pairs
+    (None for a method that is not used).
+    '''
+    samples = np.array(samples)
+    units = samples
+    cv_vrf = None
+    anti_vrf = None
+    if beta is not None:
+        units = samples - beta * (np.array(arrivals) - expected_arrivals)
+        cv_vrf = np.var(samples, ddof = 1) / np.var(units, ddof = 1)
+    if antithetic:
+        pairs = (units[0::2] + units[1::2]) / 2
+        anti_vrf = (np.var(units, ddof = 1) / len(units)) / (np.var(pairs, ddof = 1) / len(pairs))
+        units = pairs
+    return units, cv_vrf, anti_vrf
+
+lamb = float(sys.argv[1])    # arrival trial success rate
+rhos = np.arange(0.9, 1.0, 0.01)
+
+# Variance reduction options, with R=<replications> and N=<phases per replication>
+options = []
+R = None
+N = None
+for arg in sys.argv[2:]:
+    if arg.startswith("R="):
+        R = int(arg[2:])
+    elif arg.startswith("N="):
+        N = int(arg[2:])
+    elif arg in ("crn", "antithetic", "control"):
+        options.append(arg)
+    else:
+        sys.exit("Unknown option: " + arg)
+crn = "crn" in options
+antithetic = "antithetic" in options
+control = "control" in options
+
+if options:
+    R = R or 10
+    N = N or max(10000, max(int(10 / ((1 - rho) ** 2)) for rho in rhos))
+    if R < 2 or (antithetic and R % 2 == 1):
+        sys.exit("R must be at least 2 (and even for antithetic pairs) to estimate the variance reduction")
+else:
+    R = R or 1
+    N = N or 10000
+
+m = Munkres()
+traf = []
+qlen = []
+err = []
+previous = None
+
+# Simulation
+for i, rho in enumerate(rhos):   # rho: traffic intensity, noted as (ρ).
+    mu = lamb / rho * 3                  # service trial success rate -> here, 1 assumes that it dequeues every phase when the VOQ is not empty
+    traf.append(rho)
+
+    samples = []
+    arrivals = []
+    for r in range(R):
+        # Streams are seeded only for common random numbers or antithetic pairs, which share the seed.
+        # Without common random numbers every traffic intensity gets fresh seeds.
+        seed = None
+        if crn or antithetic:
+            seed = (0 if crn else i * R) + (r // 2 if antithetic else r)
+        sample_mean, arrival_count, sampled = simulate_switch(mu, N, seed, antithetic and r % 2 == 1)
+        samples.append(sample_mean)
+        arrivals.append(arrival_count)
+
+    # Recording Sampling: the arrival count has the known mean λn^2 per sampled phase
+    beta = control_coefficient(samples, arrivals) if control else None
+    units, cv_vrf, anti_vrf = estimate_mean(samples, arrivals, lamb * 9 * sampled, beta, antithetic)
+    mean = np.average(units)
 
     # Sampling the Queue-Length statistics from the simulation
     print("Traffic Intensity: " + str(rho))
     print("Average Queue Length: " + str(mean))
     print("E[q(t)] / (1 / (1 - ρ)): " + str(mean / (1 / (1 - rho))))    # testing convergence of the constant
+    if R > 1:
+        se = np.std(units, ddof = 1) / np.sqrt(len(units))
+        print("Standard Error: " + str(se))
+        err.append(se)
+    if control:
+        print("Control Variate Reduction Factor: " + str(cv_vrf))
+    if antithetic:
+        print("Antithetic Reduction Factor: " + str(anti_vrf))
+
+    # Common random numbers show up in the difference between consecutive traffic intensities
+    if crn and previous is not None:
+        crn_vrf = (np.var(units, ddof = 1) + np.var(previous, ddof = 1)) / np.var(units - previous, ddof = 1)
+        print("Common Random Numbers Reduction Factor (difference to the previous ρ): " + str(crn_vrf))
     print("--------------------------------------------------")
+    previous = units
     qlen.append(mean)
-    
+
 # Overview
 plt.title("Average Queue Length relative to Traffic Intensity")
-plt.plot(traf, qlen)
+if err:
+    plt.errorbar(traf, qlen, yerr = err)
+else:
+    plt.plot(traf, qlen)
 plt.xlabel("ρ")
 plt.ylabel("μ[q(t)]")
 plt.show()
 
-    
+
